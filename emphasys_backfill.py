@@ -0,0 +1,249 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import emphasys_integration
+import emphasys_integration_consts
+from emphasys_integration_consts import *
+
+logger = logging.getLogger()
+
+# Set in every pool process by _init_worker
+_claims = None
+
+
+class SharedRateLimiter(object):
+    '''
+    Spaces out the requests of all backfill processes to at most requests_per_second
+    '''
+
+    def __init__(self, requests_per_second):
+        self._interval = 1.0 / requests_per_second if requests_per_second else 0
+        self._lock = multiprocessing.Lock()
+        self._next_slot = multiprocessing.Value('d', 0.0, lock=False)
+
+    def wait(self):
+        if not self._interval:
+            return
+
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot.value)
+            self._next_slot.value = slot + self._interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _init_worker(rate_limiter, claims):
+    '''
+    function to share the rate limiter and the inspection claims with a pool process
+    '''
+
+    global _claims
+
+    emphasys_integration._rate_limiter = rate_limiter
+    _claims = claims
+
+
+def _make_shards(start_date, end_date, shard_days):
+    '''
+    function to split a date range into consecutive shards of shard_days days
+    '''
+
+    shards = []
+    shard_start = start_date
+    while shard_start < end_date:
+        shard_end = min(shard_start + timedelta(days=shard_days), end_date)
+        shards.append((shard_start, shard_end))
+        shard_start = shard_end
+
+    return shards
+
+
+def _merge_stats(stats_list):
+    '''
+    function to add up the counts of several syncs
+    '''
+
+    merged = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            merged[key] = merged.get(key, 0) + value
+
+    return merged
+
+
+def _read_checkpoint(path):
+    '''
+    function to read the checkpoint of a shard, empty when the shard has not been started
+    '''
+
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_checkpoint(path, checkpoint):
+    '''
+    function to atomically write the checkpoint of a shard
+    '''
+
+    tmp_path = "{}.tmp".format(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def _run_shard(shard):
+    '''
+    function to sync one shard in a pool process, resuming from its checkpoint
+    '''
+
+    shard_start, shard_end, checkpoint_path = shard
+    shard_name = os.path.basename(checkpoint_path)
+
+    checkpoint = _read_checkpoint(checkpoint_path)
+    if checkpoint.get('done'):
+        logger.debug("shard {} already done, skipping".format(shard_name))
+        return checkpoint
+
+    base_stats = checkpoint.get('stats', {})
+    if checkpoint.get('resync'):
+        # A new pass over the whole shard, inspections created by earlier passes now count as existing
+        base_stats = {'created': base_stats.get('created', 0)}
+
+    checkpoint.update({
+        'start': shard_start.isoformat(),
+        'end': shard_end.isoformat(),
+        'next_page': checkpoint.get('next_page', 1),
+        'stats': base_stats,
+        'done': False,
+        'resync': False,
+        'error': None
+    })
+
+    def on_page_done(page_number, stats):
+        checkpoint['next_page'] = page_number + 1
+        checkpoint['stats'] = _merge_stats([base_stats, stats])
+        _write_checkpoint(checkpoint_path, checkpoint)
+
+    def claim_inspection(key):
+        # setdefault runs atomically in the manager process, only the first shard gets the claim
+        return _claims.setdefault(key, shard_name) == shard_name
+
+    def release_inspection(key):
+        # Only the shard holding the claim releases it
+        _claims.pop(key, None)
+
+    logger.debug("starting shard {} from page {}".format(shard_name, checkpoint['next_page']))
+
+    try:
+        stats = emphasys_integration._sync_inspections(shard_start, shard_end, start_page=checkpoint['next_page'],
+                                                      on_page_done=on_page_done, claim_inspection=claim_inspection,
+                                                      release_inspection=release_inspection)
+        error = stats.pop('error', None)
+        # After an error the page is synced again on resume, so keep the stats of the last finished page
+        if not error:
+            checkpoint['stats'] = _merge_stats([base_stats, stats])
+    except Exception as e:
+        error = emphasys_integration._get_error_message_from_exception(e)
+
+    # Inspections that were not created are only retried by syncing the shard again
+    not_created = checkpoint['stats'].get('failed', 0) + checkpoint['stats'].get('no_slots', 0)
+    if not error and not_created:
+        error = "{} inspections were not created, the shard is synced again on the next run".format(not_created)
+        checkpoint['next_page'] = 1
+        checkpoint['resync'] = True
+
+    if error:
+        logger.debug("shard {} stopped. Error {}".format(shard_name, error))
+
+    checkpoint['done'] = not error
+    checkpoint['error'] = error
+    _write_checkpoint(checkpoint_path, checkpoint)
+
+    return checkpoint
+
+
+def _print_report(report):
+    '''
+    function to print the merged backfill report
+    '''
+
+    keys = sorted(report['totals'])
+    print("{:<20} {:<20} {:>6} ".format('start', 'end', 'status') + " ".join("{:>12}".format(k[:12]) for k in keys))
+    for shard in report['shards']:
+        status = "done" if shard.get('done') else "failed"
+        print("{:<20} {:<20} {:>6} ".format(shard['start'][:19], shard['end'][:19], status) +
+              " ".join("{:>12}".format(shard['stats'].get(k, 0)) for k in keys))
+    print("{:<20} {:<20} {:>6} ".format('total', '', '') + " ".join("{:>12}".format(report['totals'][k]) for k in keys))
+
+    for shard in report['shards']:
+        if shard.get('error'):
+            print("{} - {}: {}".format(shard['start'], shard['end'], shard['error']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill emphasys inspections into Bob.ai by splitting a date range into shards synced in parallel.")
+    parser.add_argument('--start', required=True, type=datetime.fromisoformat, help="start date, e.g. 2021-05-10 or 2021-05-10T17:18:04")
+    parser.add_argument('--end', required=True, type=datetime.fromisoformat, help="end date, e.g. 2022-05-10 or 2022-05-10T17:18:04")
+    parser.add_argument('--shard-days', type=int, default=BACKFILL_SHARD_DAYS)
+    parser.add_argument('--processes', type=int, default=BACKFILL_PROCESSES)
+    parser.add_argument('--requests-per-second', type=float, default=BACKFILL_REQUESTS_PER_SECOND,
+                        help="request rate shared by all processes, 0 disables the limit")
+    parser.add_argument('--checkpoint-dir', default=BACKFILL_CHECKPOINT_DIR)
+    parser.add_argument('--report', default=BACKFILL_REPORT_PATH)
+    args = parser.parse_args(argv)
+
+    if args.start >= args.end:
+        parser.error("--start must be before --end")
+
+    if args.shard_days <= 0:
+        parser.error("--shard-days must be greater than 0")
+
+    if args.processes < 1:
+        parser.error("--processes must be at least 1")
+
+    # Every process would open and overwrite the same cassette
+    if (emphasys_integration_consts.CASSETTE_MODE or "").lower() == "record":
+        parser.error("CASSETTE_MODE \"record\" is not supported by the backfill, record emphasys_integration.py instead")
+
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+
+    shards = [(shard_start, shard_end, os.path.join(args.checkpoint_dir, "shard_{}_{}.json".format(
+        shard_start.strftime('%Y%m%dT%H%M%S'), shard_end.strftime('%Y%m%dT%H%M%S'))))
+        for shard_start, shard_end in _make_shards(args.start, args.end, args.shard_days)]
+
+    logger.debug("backfilling {} shards with {} processes".format(len(shards), args.processes))
+
+    rate_limiter = SharedRateLimiter(args.requests_per_second)
+    with multiprocessing.Manager() as manager:
+        claims = manager.dict()
+        with multiprocessing.Pool(args.processes, initializer=_init_worker, initargs=(rate_limiter, claims)) as pool:
+            results = pool.map(_run_shard, shards, chunksize=1)
+
+    report = {
+        'start': args.start.isoformat(),
+        'end': args.end.isoformat(),
+        'shards': results,
+        'totals': _merge_stats([shard.get('stats', {}) for shard in results])
+    }
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    _print_report(report)
+
+    return 0 if all(shard.get('done') for shard in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
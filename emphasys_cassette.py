@@ -0,0 +1,391 @@
+import argparse
+import atexit
+import cProfile
+import gzip
+import io
+import json
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import emphasys_integration_consts
+
+# Keys whose values are replaced before an interaction is written to the cassette
+SCRUBBED_KEYS = {
+    'password',
+    'user_id',
+    'access_token',
+    'refresh_token',
+    'authorization',
+    'ocp-apim-subscription-key',
+    'x-ecs-client'
+}
+SCRUBBED_VALUE = "<scrubbed>"
+
+_record_file = None
+_record_lock = threading.Lock()
+_replay_interactions = None
+_replay_clock = None
+
+
+def _get_mode():
+    '''
+    function to get the current cassette mode
+    '''
+
+    return (emphasys_integration_consts.CASSETTE_MODE or "").lower()
+
+
+def _scrub(value):
+    '''
+    function to replace credential values in a parsed json value
+    '''
+
+    if isinstance(value, dict):
+        return {k: SCRUBBED_VALUE if str(k).lower() in SCRUBBED_KEYS else _scrub(v) for k, v in value.items()}
+
+    if isinstance(value, list):
+        return [_scrub(v) for v in value]
+
+    return value
+
+
+def _scrub_text(text):
+    '''
+    function to scrub credentials from a request payload or response body
+    '''
+
+    if not text:
+        return text
+
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', errors='replace')
+
+    try:
+        return json.dumps(_scrub(json.loads(text)), separators=(',', ':'))
+    except Exception:
+        return text
+
+
+def _interaction_key(method, url, params, data):
+    '''
+    function to build the key used to match a request against recorded interactions
+    '''
+
+    params = sorted((str(k), str(v)) for k, v in _scrub(params or {}).items())
+
+    return json.dumps([method.lower(), url, params, _scrub_text(data)])
+
+
+class _ReplayResponse(object):
+    '''
+    Minimal stand-in for requests.Response served from a cassette
+    '''
+
+    def __init__(self, interaction):
+        self.url = interaction['url']
+        self.status_code = interaction['status']
+        self.headers = {'Content-Type': interaction.get('content_type', '')}
+        self.text = interaction.get('body', '')
+        self.content = self.text.encode('utf-8')
+        self.encoding = 'utf-8'
+        self.elapsed = timedelta(seconds=interaction.get('elapsed', 0))
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        data = self.text if decode_unicode else self.content
+        chunk_size = chunk_size or len(data) or 1
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+def _close_record_file():
+    '''
+    function to flush and close the cassette being recorded
+    '''
+
+    global _record_file
+
+    if _record_file:
+        _record_file.close()
+        _record_file = None
+
+
+def _record(method, url, params, data, response):
+    '''
+    function to append a scrubbed request/response pair to the cassette
+    '''
+
+    try:
+        elapsed = response.elapsed.total_seconds()
+    except Exception:
+        elapsed = 0
+
+    interaction = {
+        'key': _interaction_key(method, url, params, data),
+        'method': method.lower(),
+        'url': url,
+        'status': response.status_code,
+        'content_type': response.headers.get('Content-Type', ''),
+        'body': _scrub_text(response.text),
+        'elapsed': elapsed
+    }
+
+    _write_entry(interaction)
+
+
+def _write_entry(entry):
+    '''
+    function to append one line to the cassette being recorded
+    '''
+
+    global _record_file
+
+    # Requests are made from several threads while planning inspection slots
+    with _record_lock:
+        if _record_file is None:
+            _record_file = gzip.open(emphasys_integration_consts.CASSETTE_PATH, 'wt', encoding='utf-8')
+            atexit.register(_close_record_file)
+
+        _record_file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+
+def _read_entries(path):
+    '''
+    function to read all lines of a cassette, interactions and clock readings
+    '''
+
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_cassette(path):
+    '''
+    function to read all interactions from a cassette
+    '''
+
+    return [entry for entry in _read_entries(path) if 'key' in entry]
+
+
+def _load_replay():
+    '''
+    function to load the cassette to replay on first use
+    '''
+
+    global _replay_interactions, _replay_clock
+
+    if _replay_interactions is not None:
+        return
+
+    _replay_interactions = defaultdict(deque)
+    _replay_clock = deque()
+    for entry in _read_entries(emphasys_integration_consts.CASSETTE_PATH):
+        if 'clock' in entry:
+            _replay_clock.append(entry['clock'])
+        else:
+            _replay_interactions[entry['key']].append(entry)
+
+
+def now():
+    '''
+    function to get the current time. The time is recorded in the cassette and served back
+    on replay, so request parameters built from it match the recorded ones.
+    '''
+
+    mode = _get_mode()
+
+    if mode == "replay":
+        _load_replay()
+        if _replay_clock:
+            return datetime.fromisoformat(_replay_clock.popleft() if len(_replay_clock) > 1 else _replay_clock[0])
+
+    current = datetime.now()
+
+    if mode == "record":
+        _write_entry({'clock': current.isoformat()})
+
+    return current
+
+
+def _replay(method, url, params, data):
+    '''
+    function to serve a recorded response for the given request
+    '''
+
+    _load_replay()
+
+    recorded = _replay_interactions.get(_interaction_key(method, url, params, data))
+    if not recorded:
+        raise Exception("No recorded interaction in cassette for {} {}".format(method.upper(), url))
+
+    # Requests made more often than recorded keep getting the last recorded response
+    interaction = recorded.popleft() if len(recorded) > 1 else recorded[0]
+
+    if emphasys_integration_consts.CASSETTE_REPLAY_LATENCY:
+        time.sleep(interaction.get('elapsed', 0) * emphasys_integration_consts.CASSETTE_REPLAY_LATENCY)
+
+    return _ReplayResponse(interaction)
+
+
+def send(request_func, method, url, **kwargs):
+    '''
+    function to send a request, recording or replaying it according to CASSETTE_MODE
+    '''
+
+    mode = _get_mode()
+
+    if mode == "replay":
+        return _replay(method, url, kwargs.get('params'), kwargs.get('data'))
+
+    response = request_func(url, **kwargs)
+
+    if mode == "record":
+        _record(method, url, kwargs.get('params'), kwargs.get('data'), response)
+
+    return response
+
+
+def _run_script(script):
+    '''
+    function to run one of the integration scripts as __main__
+    '''
+
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit:
+        pass
+
+
+def _print_summary(path, top):
+    '''
+    function to print per endpoint call counts and recorded latency of a cassette
+    '''
+
+    endpoints = defaultdict(lambda: {'calls': 0, 'elapsed': 0.0, 'max': 0.0, 'bytes': 0})
+    for interaction in load_cassette(path):
+        parts = urlsplit(interaction['url'])
+        stats = endpoints["{} {}{}".format(interaction['method'].upper(), parts.netloc, parts.path)]
+        stats['calls'] += 1
+        stats['elapsed'] += interaction.get('elapsed', 0)
+        stats['max'] = max(stats['max'], interaction.get('elapsed', 0))
+        stats['bytes'] += len(interaction.get('body', ''))
+
+    print("{:>6} {:>10} {:>9} {:>9} {:>11}  {}".format('calls', 'total s', 'mean s', 'max s', 'body bytes', 'endpoint'))
+    for endpoint, stats in sorted(endpoints.items(), key=lambda e: e[1]['elapsed'], reverse=True)[:top]:
+        print("{:>6} {:>10.3f} {:>9.3f} {:>9.3f} {:>11}  {}".format(
+            stats['calls'], stats['elapsed'], stats['elapsed'] / stats['calls'], stats['max'], stats['bytes'], endpoint))
+
+
+def _profile(args):
+    '''
+    function to replay a script from a cassette under cProfile and print the hot spots
+    '''
+
+    emphasys_integration_consts.CASSETTE_MODE = "replay"
+    emphasys_integration_consts.CASSETTE_PATH = args.cassette
+    emphasys_integration_consts.CASSETTE_REPLAY_LATENCY = args.latency
+
+    if args.memory:
+        tracemalloc.start()
+
+    # cProfile only follows the thread that enabled it, every thread started by the script
+    # (e.g. the propose_slots workers) gets its own profiler and the stats are merged
+    thread_profilers = []
+
+    def start_thread_profiler(frame, event, arg):
+        sys.setprofile(None)
+        thread_profiler = cProfile.Profile()
+        try:
+            thread_profiler.enable()
+        except ValueError:
+            # Newer Pythons allow one active profiler, which already sees all threads
+            return
+        thread_profilers.append(thread_profiler)
+
+    profiler = cProfile.Profile()
+    threading.setprofile(start_thread_profiler)
+    try:
+        profiler.runcall(_run_script, args.script)
+    finally:
+        threading.setprofile(None)
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    for thread_profiler in thread_profilers:
+        stats.add(thread_profiler)
+    stats.sort_stats(args.sort).print_stats(args.top)
+    print("Profiled the main thread and {} worker threads".format(len(thread_profilers)))
+    print(stream.getvalue())
+
+    if args.output:
+        stats.dump_stats(args.output)
+
+    if args.memory:
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        print("Peak traced memory: {:.1f} KiB".format(peak / 1024))
+        for stat in snapshot.statistics('lineno')[:args.top]:
+            print(stat)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record, replay and profile the integration scripts from HTTP cassettes.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help="run a script against live systems and record a cassette")
+    record_parser.add_argument('script')
+    record_parser.add_argument('--cassette', default=emphasys_integration_consts.CASSETTE_PATH)
+
+    profile_parser = subparsers.add_parser('profile', help="replay a script from a cassette and print a hot-spot report")
+    profile_parser.add_argument('script')
+    profile_parser.add_argument('--cassette', default=emphasys_integration_consts.CASSETTE_PATH)
+    profile_parser.add_argument('--latency', type=float, default=emphasys_integration_consts.CASSETTE_REPLAY_LATENCY,
+                                help="multiplier for the recorded latency, 0 replays instantly")
+    profile_parser.add_argument('--sort', default='cumulative')
+    profile_parser.add_argument('--top', type=int, default=25)
+    profile_parser.add_argument('--memory', action='store_true', help="also trace allocations with tracemalloc")
+    profile_parser.add_argument('--output', help="write the raw profile to this file")
+
+    summary_parser = subparsers.add_parser('summary', help="print per endpoint call counts and recorded latency")
+    summary_parser.add_argument('--cassette', default=emphasys_integration_consts.CASSETTE_PATH)
+    summary_parser.add_argument('--top', type=int, default=25)
+
+    args = parser.parse_args(argv)
+
+    if args.command != 'record' and not os.path.exists(args.cassette):
+        print("Cassette {} not found".format(args.cassette))
+        return 1
+
+    if args.command == 'record':
+        # When run as __main__ the scripts record through the imported copy of this module
+        import emphasys_cassette
+
+        emphasys_integration_consts.CASSETTE_MODE = "record"
+        emphasys_integration_consts.CASSETTE_PATH = args.cassette
+        _run_script(args.script)
+        emphasys_cassette._close_record_file()
+        if not os.path.exists(args.cassette):
+            print("Nothing was recorded to {}".format(args.cassette))
+            return 1
+        _print_summary(args.cassette, 25)
+    elif args.command == 'profile':
+        _profile(args)
+    else:
+        _print_summary(args.cassette, args.top)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
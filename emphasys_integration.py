@@ -1,9 +1,14 @@
 import requests
 import json
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from itertools import chain
 
+import emphasys_cassette
 from emphasys_integration_consts import *
+from emphasys_json_stream import JsonListStream
 
 logging.basicConfig(filename="emphasys.log",
                     format='%(asctime)s %(message)s',
@@ -15,9 +20,14 @@ logger = logging.getLogger()
 # Setting the threshold of logger to DEBUG
 logger.setLevel(logging.DEBUG)
 
-def _make_rest_call(url=None, params=None, headers=None, data=None, method="get"):
+# Limits the request rate of all processes of a backfill, set by emphasys_backfill.py
+_rate_limiter = None
+
+def _make_rest_call(url=None, params=None, headers=None, data=None, method="get", stream=False, list_key=None):
     ''' 
     function to make rest call
+    With stream=True a successful json response is returned as a JsonListStream over the
+    top level list or the list stored under list_key, decoded while it is downloaded.
     '''
 
     try:
@@ -26,33 +36,44 @@ def _make_rest_call(url=None, params=None, headers=None, data=None, method="get"
         error_message = _get_error_message_from_exception(e)
         return False, error_message
 
+    if _rate_limiter:
+        _rate_limiter.wait()
+
     try:
-        response = request_func(url, params=params, headers=headers, data=data)
+        response = emphasys_cassette.send(request_func, method, url, params=params, headers=headers, data=data, stream=stream)
     except Exception as e:
         error_message = _get_error_message_from_exception(e)
         return False, error_message
 
-    return _process_response(response)
+    return _process_response(response, stream, list_key)
 
-def _process_response(r):
+def _process_response(r, stream=False, list_key=None):
     ''' 
     function to process response
     '''
 
     # Process a json response
     if 'json' in r.headers.get('Content-Type', ''):
-        return _process_json_response(r)
+        return _process_json_response(r, stream, list_key)
 
     message = "Can't process response from server. Status Code: {0} Data from server: {1}".format(
             r.status_code, r.text.replace('{', '{{').replace('}', '}}'))
 
     return False, message
 
-def _process_json_response(r):
+def _process_json_response(r, stream=False, list_key=None):
     ''' 
     function to process json response
     '''
 
+    # Decode successful list responses incrementally
+    if stream and (200 <= r.status_code < 205):
+        try:
+            return True, JsonListStream(r, list_key)
+        except Exception as e:
+            logger.debug('Cannot parse JSON')
+            return False, "Unable to parse response as JSON"
+
     # Try a json parse
     try:
         resp_json = r.json()
@@ -237,187 +258,398 @@ def _create_unit(address, city, state, zipcode):
 
     return ret_val, response
 
-end_date = datetime.now()
-start_date = end_date - timedelta(days=7)
-
-logger.debug("end date {}".format(end_date))
-logger.debug("start date {}".format(start_date))
+def _propose_slots_for_inspection(inspection):
+    '''
+    function to propose slots for a pending inspection.
+    Returns (ret_val, slots or error message, whether the unit is missing in Bob.ai)
+    '''
 
-page_number = 1
-while True:
+    ret_val, propose_slot_response = _propose_available_date_time(inspection['scheduled_date'], inspection['full_address'], inspection['inspection_type'])
 
-    global access_token
-    ret_val, access_token = _login()
     if not ret_val:
-        logger.debug("Failed to create access token for BOB. Error: {}".format(access_token))
-        break
-
-    inspection_type_mapping = {
-        100001:'Annual',
-        100002:'Initial',
-        100003:'QC',
-        100004:'Complaint'
-    }
+        return False, "Error while proposing available date time in bob. Error {}".format(propose_slot_response), False
 
-    logger.debug("page number {}".format(page_number))
+    if "Unit information not found" in (propose_slot_response.get('message') or ''):
+        return True, [], True
 
-    params = {
-        'StartDate': start_date.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-        'EndDate': end_date.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-        'Page': page_number,
-        'PageSize': EMPHASYS_DEFAULT_PAGE_SIZE
-    }
+    return True, propose_slot_response.get('slots') or [], False
 
-    # params = {
-    #     'StartDate': "2021-05-10T17:18:04.03Z",
-    #     'EndDate': "2022-05-10T17:18:04.03Z",
-    #     'Page': page_number,
-    #     'PageSize': EMPHASYS_DEFAULT_PAGE_SIZE
-    # }
+def _create_unit_for_inspection(inspection):
+    '''
+    function to create the unit of a pending inspection in Bob.ai
+    '''
 
-    headers = {
-    'Ocp-Apim-Subscription-Key': EMPHASYS_SUBSCRIPTION_KEY,
-    'x-ecs-client': EMPHASYS_ECS_CLIENT,
-    'Cache-Control': 'no-cache'
-    }
+    unit = inspection['unit']
+    if unit.get('unitSuite'):
+        return _create_unit('{} {}'.format(unit.get('unitPrimaryStreet'), unit.get('unitSuite')), unit.get('unitCity'), unit.get('unitState'), unit.get('unitZip'))
 
-    ret_val, emphasys_response = _make_rest_call(url=EMPHASYS_INSPECTION_API_URL, params=params, headers=headers, method="get")
+    return _create_unit(unit.get('unitPrimaryStreet'), unit.get('unitCity'), unit.get('unitState'), unit.get('unitZip'))
 
-    if not ret_val:
-        logger.debug("Error while fetching inspections from emphasys. Error {}".format(emphasys_response))
-        break
+def _propose_slots(pending_inspections):
+    '''
+    function to propose slots for all pending inspections concurrently, creating the units missing in Bob.ai.
+    Returns (ret_val, slots or error message) for every inspection.
+    '''
 
-    if not emphasys_response.get('inspections'):
-        logger.debug("No inspections found on emphasys in last 7 days")
-        break
+    with ThreadPoolExecutor(max_workers=BOB_AI_PROPOSE_SLOTS_CONCURRENCY) as executor:
+        proposals = list(executor.map(_propose_slots_for_inspection, pending_inspections))
+
+        # If unit is not available in the BOB, create the unit in the BOB. Units are created one at a
+        # time so inspections of the same new unit on different dates only create it once.
+        unit_errors = {}
+        missing_units = [i for i, (ret_val, slots, unit_missing) in enumerate(proposals) if unit_missing]
+        for i in missing_units:
+            full_address = pending_inspections[i]['full_address']
+            if full_address not in unit_errors:
+                ret_val, response = _create_unit_for_inspection(pending_inspections[i])
+                unit_errors[full_address] = None if ret_val else "Error while creating an unit to BOB. Error {}".format(response)
+
+        created_units = [i for i in missing_units if not unit_errors[pending_inspections[i]['full_address']]]
+        for i, proposal in zip(created_units, executor.map(_propose_slots_for_inspection, [pending_inspections[i] for i in created_units])):
+            proposals[i] = proposal
+
+    results = []
+    for inspection, (ret_val, slots, unit_missing) in zip(pending_inspections, proposals):
+        if unit_errors.get(inspection['full_address']):
+            results.append((False, unit_errors[inspection['full_address']]))
+        elif unit_missing:
+            results.append((False, "Unit information not found in bob after creating the unit"))
+        else:
+            results.append((ret_val, slots))
 
-    for unit in emphasys_response.get('inspections'):
+    return results
 
-        try:
-            if unit.get('unitSuite'):
-                full_address = "{} {} {} {} {}".format(unit.get('unitPrimaryStreet'),unit.get('unitSuite'),
-                unit.get('unitCity'), unit.get('unitState'), unit.get('unitZip')).upper()
-            else:
-                full_address = "{} {} {} {}".format(unit.get('unitPrimaryStreet'),unit.get('unitCity'),
-                unit.get('unitState'), unit.get('unitZip')).upper()
-        except Exception as e:
-            logger.debug("Error occured while creating address from emphasys inspections for inspection {}. Error {}".format(unit['inspectionID'], _get_error_message_from_exception(e)))
+def _slot_key(slot, scheduled_date):
+    '''
+    function to get the date, WorkerID and Sequence identifying a slot
+    '''
 
-        try:
-            scheduled_date = unit.get("instanceList")[0]['scheduledDate']
-        except Exception as e:
-            logger.debug("Error occured while getting the scheduled date of an inspection {}. Error {}".format(unit['inspectionID'], _get_error_message_from_exception(e)))
+    return (slot.get("ScheduledDate") or scheduled_date, slot.get("WorkerID"), slot.get("Sequence"))
 
-        if scheduled_date:
-            scheduled_date = datetime.strptime(scheduled_date, '%Y-%m-%dT%H:%M:%SZ').strftime('%m/%d/%Y')
-            # scheduled_date = "07/04/2022"
+def _book_slot(slots, booked_slots, scheduled_date):
+    '''
+    function to book the first proposed slot that is not in booked_slots yet
+    '''
 
-        if unit.get('fkInspectionType'):
-            inspection_type = inspection_type_mapping[unit['fkInspectionType']]
-        else:
-            inspection_type = None
-        
-        if unit.get('inspectionID'):
-            emphasys_inspection_id = unit['inspectionID']
-        else:
-            emphasys_inspection_id = None
-        
-        logger.debug("inspection full address {}".format(full_address))
-        logger.debug("inspection scheduled date {}".format(scheduled_date))
-        logger.debug("inspection inspection type {}".format(inspection_type))
-        logger.debug("inspection emphasys inspection id {}".format(emphasys_inspection_id))
+    for slot in slots:
+        if _slot_key(slot, scheduled_date) not in booked_slots:
+            booked_slots.add(_slot_key(slot, scheduled_date))
+            return slot
+
+    return None
+
+def _plan_inspection_slots(pending_inspections, booked_slots):
+    '''
+    function to assign a proposed slot to every pending inspection.
+    Slots are proposed concurrently, then assigned per scheduled date so that no WorkerID/Sequence
+    in booked_slots is given out twice. Returns (inspection, slot, error) for every inspection, and
+    the inspections whose proposed slots were all given to other inspections.
+    '''
 
+    proposals = _propose_slots(pending_inspections)
 
-        # check whether the inspection is available on BOB or not
-        if scheduled_date and full_address:
-            ret_val, response = _check_inspection_from_bob_ai("{},{}".format(scheduled_date,scheduled_date), full_address)
+    inspections_by_date = defaultdict(list)
+    for inspection, (ret_val, slots) in zip(pending_inspections, proposals):
+        inspections_by_date[inspection['scheduled_date']].append((inspection, ret_val, slots))
 
+    planned = []
+    conflicted = []
+    for scheduled_date, inspections in inspections_by_date.items():
+        # Inspections with the fewest proposed slots pick first so they are not left without one
+        for inspection, ret_val, slots in sorted(inspections, key=lambda i: len(i[2]) if i[1] else 0):
             if not ret_val:
-                logger.debug("Error while checking inspection on bob. Error {}".format(response))
+                planned.append((inspection, None, slots))
                 continue
-            
-            try:
-                total_count = response.get("total_count")
-            except Exception as e:
-                logger.debug("Error while fetching total count {}".format(_get_error_message_from_exception(e)))
-
-            if total_count:
-                logger.debug("inspection is already there")
-                bob_inspection_list = response.get('data', [])
-                if emphasys_inspection_id:
-                    if bob_inspection_list:
-                        bob_inspection_instance_id = bob_inspection_list[0].get('agency_instance_id')
-                        if bob_inspection_instance_id == emphasys_inspection_id:
-                            logger.debug("Bob instance id and emphasys instance id matched for emphasys instance id: {}".format(emphasys_inspection_id))
-                            continue
-                        else:
-                            ret_val, response = _update_emphasys_inspection_id_bob(bob_inspection_list[0].get('ID'), emphasys_inspection_id)
-
-                            if not ret_val:
-                                logger.debug("Error while updating instance id to bob. continuing with the next inspection. Error {}".format(propose_slot_response))
-                                continue
-            else:
-                # If inspection is not available propose date and time to create an inspection
-                ret_val, propose_slot_response = _propose_available_date_time(scheduled_date, full_address, inspection_type)
 
-                if not ret_val:
-                    logger.debug("Error while proposing available date time in bob. continuing with the next inspection. Error {}".format(propose_slot_response))
-                    continue
+            slot = _book_slot(slots, booked_slots, scheduled_date)
 
-                # If unit is not available in the BOB, create the unit in the BOB
-                if "Unit information not found" in propose_slot_response.get('message'):
-                    if unit.get('unitSuite'):
-                        ret_val, response = _create_unit('{} {}'.format(unit.get('unitPrimaryStreet'), unit.get('unitSuite')), unit.get('unitCity'), unit.get('unitState'), unit.get('unitZip'))
-                    else:
-                        ret_val, response = _create_unit(unit.get('unitPrimaryStreet'), unit.get('unitCity'), unit.get('unitState'), unit.get('unitZip'))
+            if slots and not slot:
+                conflicted.append(inspection)
+                continue
 
-                        if not ret_val:
-                            logger.debug("Error while creating an unit to BOB. Error {}".format(response))
-                            continue
+            logger.debug("planned slot {} for inspection at {} on {}".format(slot, inspection['full_address'], scheduled_date))
+            planned.append((inspection, slot, None))
 
-                        # If inspection is not available propose date and time to create an inspection
-                        ret_val, propose_slot_response = _propose_available_date_time(scheduled_date, full_address, inspection_type)
+    return planned, conflicted
 
-                        if not ret_val:
-                            logger.debug("Error while proposing available date time in bob. continuing with the next inspection. Error {}".format(propose_slot_response))
-                            continue
+def _replan_inspection_slot(inspection, booked_slots):
+    '''
+    function to propose and book a slot again for an inspection whose planned slots were taken.
+    Returns (inspection, slot, error) like _plan_inspection_slots.
+    '''
 
-                # If slots are not available
-                if not propose_slot_response.get('slots'):
-                    logger.debug("No available slots for given address on scheduled date. continuing with the next inspection")
-                    continue
+    ret_val, slots, unit_missing = _propose_slots_for_inspection(inspection)
+
+    if not ret_val:
+        return inspection, None, slots
 
-                worker_id = propose_slot_response.get('slots')[0].get("WorkerID")
-                sequence = propose_slot_response.get('slots')[0].get("Sequence")
-                list_schedules = propose_slot_response.get('slots')[0].get("ListSchedules")
-                create_inspection_scheduled_date = propose_slot_response.get('slots')[0].get("ScheduledDate")
+    slot = _book_slot(slots, booked_slots, inspection['scheduled_date'])
 
+    logger.debug("replanned slot {} for inspection at {} on {}".format(slot, inspection['full_address'], inspection['scheduled_date']))
 
-                # Finally create an inspection
+    return inspection, slot, None
+
+def _create_inspection_in_slot(inspection, slot):
+    '''
+    function to create a planned inspection in its slot, returns True when it was created
+    '''
+
+    worker_id = slot.get("WorkerID")
+    sequence = slot.get("Sequence")
+    list_schedules = slot.get("ListSchedules")
+    create_inspection_scheduled_date = slot.get("ScheduledDate")
+
+    unit = inspection['unit']
+    if unit.get('unitSuite'):
+        create_inspection_address = '{} {} {} {} {}'.format(unit.get('unitPrimaryStreet').upper(), unit.get('unitSuite').upper(), unit.get('unitCity').upper(), unit.get('unitState').upper(), unit.get('unitZip'))
+    else:
+        create_inspection_address = '{} {} {} {}'.format(unit.get('unitPrimaryStreet').upper(), unit.get('unitCity').upper(), unit.get('unitState').upper(), unit.get('unitZip'))
+
+    ret_val, response = _create_inspection(create_inspection_scheduled_date, create_inspection_address, worker_id, sequence, list_schedules, inspection['inspection_type'])
+
+    if not ret_val:
+        logger.debug("Error while creating an inspection in bob. continuing with the next inspection. Error {}".format(response))
+        return False
+
+    if response.get('message') == "success":
+        logger.debug("successfully created inspection")
+        return True
+
+    logger.debug("Error occured in creating an inspection {}".format(response))
+    return False
+
+def _sync_inspections(start_date, end_date, start_page=1, on_page_done=None, claim_inspection=None, release_inspection=None):
+    '''
+    function to sync emphasys inspections generated or modified between start_date and end_date into Bob.ai
+    on_page_done(page_number, stats) is called after every processed page and claim_inspection(key) must
+    return True before an inspection is created, so parallel backfill shards never create the same one.
+    release_inspection(key) is called when a claimed inspection could not be created, so another shard may retry it.
+    Returns the counts of what was done, with an 'error' entry when the sync stopped early.
+    '''
+
+    global access_token
+
+    logger.debug("end date {}".format(end_date))
+    logger.debug("start date {}".format(start_date))
+
+    stats = {
+        'pages': 0,
+        'inspections': 0,
+        'existing': 0,
+        'updated': 0,
+        'created': 0,
+        'no_slots': 0,
+        'claimed_by_other_shard': 0,
+        'failed': 0
+    }
+
+    # WorkerID/Sequence pairs already given to an inspection during this sync
+    booked_slots = set()
+
+    page_number = start_page
+    while True:
+
+        ret_val, access_token = _login()
+        if not ret_val:
+            logger.debug("Failed to create access token for BOB. Error: {}".format(access_token))
+            stats['error'] = access_token
+            break
+
+        inspection_type_mapping = {
+            100001:'Annual',
+            100002:'Initial',
+            100003:'QC',
+            100004:'Complaint'
+        }
+
+        logger.debug("page number {}".format(page_number))
+
+        params = {
+            'StartDate': start_date.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            'EndDate': end_date.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            'Page': page_number,
+            'PageSize': EMPHASYS_DEFAULT_PAGE_SIZE
+        }
+
+        # params = {
+        #     'StartDate': "2021-05-10T17:18:04.03Z",
+        #     'EndDate': "2022-05-10T17:18:04.03Z",
+        #     'Page': page_number,
+        #     'PageSize': EMPHASYS_DEFAULT_PAGE_SIZE
+        # }
+
+        headers = {
+        'Ocp-Apim-Subscription-Key': EMPHASYS_SUBSCRIPTION_KEY,
+        'x-ecs-client': EMPHASYS_ECS_CLIENT,
+        'Cache-Control': 'no-cache'
+        }
+
+        ret_val, emphasys_response = _make_rest_call(url=EMPHASYS_INSPECTION_API_URL, params=params, headers=headers, method="get", stream=True, list_key='inspections')
+
+        if not ret_val:
+            logger.debug("Error while fetching inspections from emphasys. Error {}".format(emphasys_response))
+            stats['error'] = emphasys_response
+            break
+
+        if not emphasys_response.get('inspections'):
+            # An empty list is only the end of the data when the page could be read
+            if emphasys_response.error:
+                logger.debug("Error while fetching inspections from emphasys. Error {}".format(emphasys_response.error))
+                stats['error'] = emphasys_response.error
+                break
+
+            logger.debug("No inspections found on emphasys between {} and {}".format(start_date, end_date))
+            break
+
+        pending_inspections = []
+        pending_keys = set()
+        for unit in emphasys_response.get('inspections'):
+
+            stats['inspections'] += 1
+
+            try:
                 if unit.get('unitSuite'):
-                    create_inspection_address = '{} {} {} {} {}'.format(unit.get('unitPrimaryStreet').upper(), unit.get('unitSuite').upper(), unit.get('unitCity').upper(), unit.get('unitState').upper(), unit.get('unitZip'))
+                    full_address = "{} {} {} {} {}".format(unit.get('unitPrimaryStreet'),unit.get('unitSuite'),
+                    unit.get('unitCity'), unit.get('unitState'), unit.get('unitZip')).upper()
                 else:
-                    create_inspection_address = '{} {} {} {}'.format(unit.get('unitPrimaryStreet').upper(), unit.get('unitCity').upper(), unit.get('unitState').upper(), unit.get('unitZip'))
+                    full_address = "{} {} {} {}".format(unit.get('unitPrimaryStreet'),unit.get('unitCity'),
+                    unit.get('unitState'), unit.get('unitZip')).upper()
+            except Exception as e:
+                logger.debug("Error occured while creating address from emphasys inspections for inspection {}. Error {}".format(unit['inspectionID'], _get_error_message_from_exception(e)))
+
+            try:
+                scheduled_date = unit.get("instanceList")[0]['scheduledDate']
+            except Exception as e:
+                logger.debug("Error occured while getting the scheduled date of an inspection {}. Error {}".format(unit['inspectionID'], _get_error_message_from_exception(e)))
+
+            if scheduled_date:
+                scheduled_date = datetime.strptime(scheduled_date, '%Y-%m-%dT%H:%M:%SZ').strftime('%m/%d/%Y')
+                # scheduled_date = "07/04/2022"
+
+            if unit.get('fkInspectionType'):
+                inspection_type = inspection_type_mapping[unit['fkInspectionType']]
+            else:
+                inspection_type = None
+        
+            if unit.get('inspectionID'):
+                emphasys_inspection_id = unit['inspectionID']
+            else:
+                emphasys_inspection_id = None
+        
+            logger.debug("inspection full address {}".format(full_address))
+            logger.debug("inspection scheduled date {}".format(scheduled_date))
+            logger.debug("inspection inspection type {}".format(inspection_type))
+            logger.debug("inspection emphasys inspection id {}".format(emphasys_inspection_id))
+
 
-                ret_val, response = _create_inspection(create_inspection_scheduled_date, create_inspection_address, worker_id, sequence, list_schedules, inspection_type)
+            # check whether the inspection is available on BOB or not
+            if scheduled_date and full_address:
+                ret_val, response = _check_inspection_from_bob_ai("{},{}".format(scheduled_date,scheduled_date), full_address)
 
                 if not ret_val:
-                    logger.debug("Error while creating an inspection in bob. continuing with the next inspection. Error {}".format(response))
+                    logger.debug("Error while checking inspection on bob. Error {}".format(response))
+                    stats['failed'] += 1
                     continue
-                
-                if response.get('message') == "success":
-                    logger.debug("successfully created inspection")
+            
+                try:
+                    total_count = response.get("total_count")
+                except Exception as e:
+                    logger.debug("Error while fetching total count {}".format(_get_error_message_from_exception(e)))
+
+                if total_count:
+                    logger.debug("inspection is already there")
+                    stats['existing'] += 1
+                    bob_inspection_list = response.get('data', [])
+                    if emphasys_inspection_id:
+                        if bob_inspection_list:
+                            bob_inspection_instance_id = bob_inspection_list[0].get('agency_instance_id')
+                            if bob_inspection_instance_id == emphasys_inspection_id:
+                                logger.debug("Bob instance id and emphasys instance id matched for emphasys instance id: {}".format(emphasys_inspection_id))
+                                continue
+                            else:
+                                ret_val, response = _update_emphasys_inspection_id_bob(bob_inspection_list[0].get('ID'), emphasys_inspection_id)
+
+                                if not ret_val:
+                                    logger.debug("Error while updating instance id to bob. continuing with the next inspection. Error {}".format(response))
+                                    stats['failed'] += 1
+                                    continue
+
+                                stats['updated'] += 1
                 else:
-                    logger.debug("Error occured in creating an inspection {}".format(response))
+                    # Inspections listed twice on the page are only created once
+                    if (scheduled_date, full_address) in pending_keys:
+                        logger.debug("inspection is already pending creation")
+                        continue
+
+                    # Make sure no other backfill shard is creating the same inspection
+                    claim_key = "{} {}".format(scheduled_date, full_address)
+                    if claim_inspection and not claim_inspection(claim_key):
+                        logger.debug("inspection is being created by another shard")
+                        stats['claimed_by_other_shard'] += 1
+                        continue
+
+                    pending_keys.add((scheduled_date, full_address))
+                    pending_inspections.append({
+                        'unit': unit,
+                        'scheduled_date': scheduled_date,
+                        'full_address': full_address,
+                        'inspection_type': inspection_type,
+                        'claim_key': claim_key
+                    })
+
+        # Propose slots for the inspections missing in Bob.ai and assign them without double-booking
+        planned_inspections, conflicted_inspections = _plan_inspection_slots(pending_inspections, booked_slots)
+
+        # Inspections whose proposed slots went to others on the page are proposed again one at a
+        # time, lazily, so every proposal already sees the inspections created before it
+        replanned_inspections = (_replan_inspection_slot(inspection, booked_slots) for inspection in conflicted_inspections)
+
+        for inspection, slot, error in chain(planned_inspections, replanned_inspections):
+
+            if error:
+                logger.debug("{}. continuing with the next inspection".format(error))
+                stats['failed'] += 1
+            elif not slot:
+                # If slots are not available
+                logger.debug("No available slots for given address on scheduled date. continuing with the next inspection")
+                stats['no_slots'] += 1
+            elif _create_inspection_in_slot(inspection, slot):
+                # Finally create an inspection
+                stats['created'] += 1
+                continue
+            else:
+                # The slot is still free in Bob.ai, let a later inspection have it
+                booked_slots.discard(_slot_key(slot, inspection['scheduled_date']))
+                stats['failed'] += 1
 
-    try:
-        # When page count matches break the loop
-        if page_number == emphasys_response.get("pageCount"):
-            logger.debug("page count {}".format(emphasys_response.get("pageCount")))
-            logger.debug("breaking.....")
+            if release_inspection:
+                release_inspection(inspection['claim_key'])
+
+        if emphasys_response.error:
+            logger.debug("Error while fetching inspections from emphasys. Error {}".format(emphasys_response.error))
+            stats['error'] = emphasys_response.error
             break
-    except Exception as e:
-        logger.debug("Exception occured while fetching the page count from the response. Breaking....")
-        break
 
-    page_number = page_number + 1
+        stats['pages'] += 1
+        if on_page_done:
+            on_page_done(page_number, stats)
+
+        try:
+            # When page count matches break the loop
+            if page_number == emphasys_response.get("pageCount"):
+                logger.debug("page count {}".format(emphasys_response.get("pageCount")))
+                logger.debug("breaking.....")
+                break
+        except Exception as e:
+            logger.debug("Exception occured while fetching the page count from the response. Breaking....")
+            break
+
+        page_number = page_number + 1
+
+    return stats
+
+if __name__ == "__main__":
+    end_date = emphasys_cassette.now()
+    start_date = end_date - timedelta(days=7)
+
+    _sync_inspections(start_date, end_date)
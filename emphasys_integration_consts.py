@@ -18,3 +18,24 @@ EPHASYS_INSPECTION_TYPES_URL = "https://api.gw.emphasyspha.com/inspections/v11/S
 EMPHASYS_INSPECTION_API_URL = "https://api.gw.emphasyspha.com/inspections/v11/Inspections/GetGeneratedOrModifiedInspections"
 EMPHASYS_DEFAULT_PAGE_SIZE = 10
 BOB_AI_LOGIN_URL = "{}/bobUserApi.xsjs?func=login".format(BOB_INSTANCE)
+
+# Cassette constants (record/replay of HTTP calls for offline profiling)
+# CASSETTE_MODE can be "", "record" or "replay"
+CASSETTE_MODE = ""
+CASSETTE_PATH = "emphasys_cassette.jsonl.gz"
+# Multiplier applied to the recorded latency on replay. 0 replays instantly.
+CASSETTE_REPLAY_LATENCY = 0
+
+# Size in bytes of the chunks read while streaming large list responses
+JSON_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Backfill constants
+BACKFILL_SHARD_DAYS = 30
+BACKFILL_PROCESSES = 4
+# Maximum number of requests per second across all backfill processes
+BACKFILL_REQUESTS_PER_SECOND = 5
+BACKFILL_CHECKPOINT_DIR = "backfill_checkpoints"
+BACKFILL_REPORT_PATH = "backfill_report.json"
+
+# Number of propose_slots calls made at the same time while planning new inspections
+BOB_AI_PROPOSE_SLOTS_CONCURRENCY = 5
@@ -0,0 +1,216 @@
+import codecs
+import json
+import logging
+from collections import deque
+
+from emphasys_integration_consts import JSON_STREAM_CHUNK_SIZE
+
+logger = logging.getLogger()
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789.eE+-'
+
+
+class JsonListStream(object):
+    '''
+    Incrementally decodes a json list response and yields its records as they are downloaded.
+
+    The list is either the whole body (list_key=None) or the value stored under list_key
+    in the top level object. Other top level fields are available through get() once the
+    records before them have been read.
+    '''
+
+    def __init__(self, r, list_key=None):
+        self._response = r
+        self._chunks = r.iter_content(JSON_STREAM_CHUNK_SIZE)
+        self._text_decoder = codecs.getincrementaldecoder(r.encoding or 'utf-8')(errors='replace')
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._list_key = list_key
+        self._has_list = False
+        self._in_list = False
+        self._first_item = True
+        self._fields = {}
+        self._pending = deque()
+        self.error = None
+
+        self._open()
+
+    def _fill(self):
+        '''
+        function to append the next downloaded chunk to the buffer
+        '''
+
+        if self._eof:
+            return False
+
+        # Drop what has already been decoded so the buffer stays small
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._buffer += self._text_decoder.decode(b'', final=True)
+            self._eof = True
+            return False
+
+        self._buffer += self._text_decoder.decode(chunk)
+        return True
+
+    def _peek_char(self):
+        '''
+        function to skip whitespace and return the next character, or '' at the end of the body
+        '''
+
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        '''
+        function to consume one of the expected structural characters
+        '''
+
+        c = self._peek_char()
+        if not c or c not in chars:
+            raise ValueError("Expected one of {} at position {} of the json body".format(chars, self._pos))
+        self._pos += 1
+        return c
+
+    def _decode_value(self):
+        '''
+        function to decode the next complete json value, downloading more data as needed
+        '''
+
+        self._peek_char()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+                # A number followed only by number characters up to the end of the buffer, like 12 from
+                # '12.' or '12e', may continue in the next chunk
+                number_may_continue = isinstance(value, (int, float)) and all(c in _NUMBER_CHARS for c in self._buffer[end:])
+                if self._eof or not number_may_continue:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def _read_fields(self):
+        '''
+        function to read key/value pairs of the top level object up to the list or the closing brace
+        '''
+
+        while True:
+            if self._peek_char() == '}':
+                self._pos += 1
+                return
+
+            key = self._decode_value()
+            self._expect(':')
+
+            if key == self._list_key and self._peek_char() == '[':
+                self._pos += 1
+                self._has_list = True
+                self._in_list = True
+                return
+
+            self._fields[key] = self._decode_value()
+
+            if self._expect(',}') == '}':
+                return
+
+    def _open(self):
+        '''
+        function to read the body up to the start of the list
+        '''
+
+        if self._list_key is None:
+            self._expect('[')
+            self._has_list = True
+            self._in_list = True
+        else:
+            self._expect('{')
+            self._read_fields()
+
+        if not self._in_list:
+            self._close()
+
+    def _close(self):
+        '''
+        function to release the connection once the body has been read
+        '''
+
+        try:
+            self._response.close()
+        except Exception:
+            pass
+
+    def _next_item(self):
+        '''
+        function to decode the next record of the list, returns False when the list is exhausted
+        '''
+
+        if not self._in_list:
+            return False
+
+        if self._peek_char() == ']':
+            self._pos += 1
+            self._in_list = False
+        else:
+            if not self._first_item:
+                self._expect(',')
+            self._first_item = False
+            self._pending.append(self._decode_value())
+            return True
+
+        # Read whatever follows the list in the top level object
+        if self._list_key is not None and self._expect(',}') == ',':
+            self._read_fields()
+
+        self._close()
+        return False
+
+    def _safe_next_item(self):
+        '''
+        function to decode the next record, recording download and parse errors instead of raising them
+        '''
+
+        try:
+            return self._next_item()
+        except Exception as e:
+            self.error = "Error while streaming json response. Error {}".format(e)
+            logger.debug(self.error)
+            self._in_list = False
+            self._close()
+            return False
+
+    def __iter__(self):
+        while self._pending or self._safe_next_item():
+            yield self._pending.popleft()
+
+    def __bool__(self):
+        return bool(self._pending) or self._safe_next_item()
+
+    def get(self, key, default=None):
+        '''
+        function to get a top level field, the list itself is returned as this stream
+        '''
+
+        if key == self._list_key and self._has_list:
+            return self
+
+        if key not in self._fields and self._in_list:
+            # The field comes after the list, keep the remaining records for later iteration
+            while self._safe_next_item():
+                pass
+
+        return self._fields.get(key, default)
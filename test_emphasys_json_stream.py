@@ -0,0 +1,112 @@
+import json
+import unittest
+
+from emphasys_json_stream import JsonListStream
+
+
+class _FakeResponse(object):
+    '''
+    Serves a body in chunks of a fixed size like requests.Response.iter_content
+    '''
+
+    encoding = None
+
+    def __init__(self, body, chunk_size):
+        self.content = body.encode('utf-8')
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), self.chunk_size):
+            yield self.content[i:i + self.chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+def _chunk_sizes(body):
+    return range(1, len(body.encode('utf-8')) + 1)
+
+
+class JsonListStreamTest(unittest.TestCase):
+
+    def test_records_and_fields_around_the_list(self):
+        body = json.dumps({
+            'ratio': 12.5,
+            'pageCount': 3,
+            'inspections': [{'inspectionID': i, 'unitCity': 'é' * i, 'score': -1.5e+10} for i in range(5)],
+            'total': 1234567,
+            'scale': 0.25,
+            'tags': [1, 2]
+        })
+        expected = json.loads(body)
+
+        for chunk_size in _chunk_sizes(body):
+            response = _FakeResponse(body, chunk_size)
+            stream = JsonListStream(response, 'inspections')
+
+            self.assertEqual(stream.get('ratio'), 12.5, chunk_size)
+            self.assertTrue(stream.get('inspections'), chunk_size)
+            self.assertEqual(list(stream.get('inspections')), expected['inspections'], chunk_size)
+            self.assertEqual(stream.get('total'), 1234567, chunk_size)
+            self.assertEqual(stream.get('scale'), 0.25, chunk_size)
+            self.assertEqual(stream.get('tags'), [1, 2], chunk_size)
+            self.assertIsNone(stream.error, chunk_size)
+            self.assertTrue(response.closed, chunk_size)
+
+    def test_field_after_the_list_is_read_before_the_records(self):
+        body = json.dumps({'inspections': [{'a': 1}, {'a': 2}], 'pageCount': 2})
+
+        for chunk_size in _chunk_sizes(body):
+            stream = JsonListStream(_FakeResponse(body, chunk_size), 'inspections')
+
+            self.assertEqual(stream.get('pageCount'), 2, chunk_size)
+            self.assertEqual(list(stream), [{'a': 1}, {'a': 2}], chunk_size)
+
+    def test_top_level_list_of_numbers(self):
+        body = '[12.5, -3, 1e-7, 40, 7.25E+3]'
+
+        for chunk_size in _chunk_sizes(body):
+            stream = JsonListStream(_FakeResponse(body, chunk_size))
+
+            self.assertEqual(list(stream), [12.5, -3, 1e-7, 40, 7250.0], chunk_size)
+            self.assertIsNone(stream.error, chunk_size)
+
+    def test_empty_and_missing_list(self):
+        for body in ('{"inspections": [], "pageCount": 0}', '{"pageCount": 0}', '{"inspections": null, "pageCount": 0}'):
+            for chunk_size in _chunk_sizes(body):
+                stream = JsonListStream(_FakeResponse(body, chunk_size), 'inspections')
+
+                self.assertFalse(stream.get('inspections'), (body, chunk_size))
+                self.assertEqual(stream.get('pageCount'), 0, (body, chunk_size))
+                self.assertIsNone(stream.error, (body, chunk_size))
+
+    def test_truncated_body_keeps_records_and_sets_error(self):
+        body = '{"pageCount": 5, "inspections": [{"a": 1}, {"a": 2}, {"a": '
+
+        for chunk_size in _chunk_sizes(body):
+            response = _FakeResponse(body, chunk_size)
+            stream = JsonListStream(response, 'inspections')
+
+            self.assertEqual(list(stream), [{'a': 1}, {'a': 2}], chunk_size)
+            self.assertTrue(stream.error, chunk_size)
+            self.assertTrue(response.closed, chunk_size)
+
+    def test_truncated_before_first_record_is_an_error(self):
+        body = '{"pageCount": 5, "inspections": [{"inspectionID": 1, "unitPrimar'
+
+        for chunk_size in _chunk_sizes(body):
+            stream = JsonListStream(_FakeResponse(body, chunk_size), 'inspections')
+
+            self.assertFalse(stream.get('inspections'), chunk_size)
+            self.assertTrue(stream.error, chunk_size)
+
+    def test_invalid_body_raises_before_the_list(self):
+        for body in ('', '{"pageCount": 5,', 'not json', '{"pageCount": 12.}'):
+            for chunk_size in range(1, len(body) + 2):
+                with self.assertRaises(ValueError, msg=(body, chunk_size)):
+                    JsonListStream(_FakeResponse(body, chunk_size), 'inspections')
+
+
+if __name__ == "__main__":
+    unittest.main()
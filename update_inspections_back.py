@@ -4,7 +4,9 @@ import json
 import logging
 from datetime import datetime, timedelta
 
+import emphasys_cassette
 from emphasys_integration_consts import *
+from emphasys_json_stream import JsonListStream
 
 logging.basicConfig(filename="emphasys.log",
                     format='%(asctime)s %(message)s',
@@ -16,9 +18,11 @@ logger = logging.getLogger()
 # Setting the threshold of logger to DEBUG
 logger.setLevel(logging.DEBUG)
 
-def _make_rest_call(url=None, params=None, headers=None, data=None, method="get"):
+def _make_rest_call(url=None, params=None, headers=None, data=None, method="get", stream=False, list_key=None):
     ''' 
     function to make rest call
+    With stream=True a successful json response is returned as a JsonListStream over the
+    top level list or the list stored under list_key, decoded while it is downloaded.
     '''
 
     try:
@@ -28,32 +32,40 @@ def _make_rest_call(url=None, params=None, headers=None, data=None, method="get"
         return False, error_message
 
     try:
-        response = request_func(url, params=params, headers=headers, data=data)
+        response = emphasys_cassette.send(request_func, method, url, params=params, headers=headers, data=data, stream=stream)
     except Exception as e:
         error_message = _get_error_message_from_exception(e)
         return False, error_message
 
-    return _process_response(response)
+    return _process_response(response, stream, list_key)
 
-def _process_response(r):
+def _process_response(r, stream=False, list_key=None):
     ''' 
     function to process response
     '''
 
     # Process a json response
     if 'json' in r.headers.get('Content-Type', ''):
-        return _process_json_response(r)
+        return _process_json_response(r, stream, list_key)
 
     message = "Can't process response from server. Status Code: {0} Data from server: {1}".format(
             r.status_code, r.text.replace('{', '{{').replace('}', '}}'))
 
     return False, message
 
-def _process_json_response(r):
+def _process_json_response(r, stream=False, list_key=None):
     ''' 
     function to process json response
     '''
 
+    # Decode successful list responses incrementally
+    if stream and (200 <= r.status_code < 205):
+        try:
+            return True, JsonListStream(r, list_key)
+        except Exception as e:
+            logger.debug('Cannot parse JSON')
+            return False, "Unable to parse response as JSON"
+
     # Try a json parse
     try:
         resp_json = r.json()
@@ -139,11 +151,11 @@ def _check_inspection_from_bob_ai(start_date, end_date):
         'Authorization': 'Bearer {}'.format(access_token)
     }
 
-    ret_val, response = _make_rest_call(url=BOB_AI_INSPECTION_GET_URL, params=params, headers=headers)
+    ret_val, response = _make_rest_call(url=BOB_AI_INSPECTION_GET_URL, params=params, headers=headers, stream=True, list_key='data')
 
     return ret_val, response
 
-end_date = datetime.now()
+end_date = emphasys_cassette.now()
 start_date = end_date - timedelta(days=7)
 
 logger.debug("end date {}".format(end_date))
@@ -167,13 +179,15 @@ headers = {
     'Cache-Control': 'no-cache'
 }
 
-ret_val, emphasys_inspectors_results = _make_rest_call(url="https://api.gw.emphasyspha.com/inspections/v11/Setups/Inspectors", headers=headers, method="get")
+ret_val, emphasys_inspectors_results = _make_rest_call(url="https://api.gw.emphasyspha.com/inspections/v11/Setups/Inspectors", headers=headers, method="get", stream=True)
 
 emphasys_inspectors = {}
 if not ret_val:
     logger.debug("Error while fetching inspections from emphasys. Error {}".format(emphasys_inspectors_results))
 else:
     emphasys_inspectors = {i['inspectorName']:i['pk'] for i in emphasys_inspectors_results}
+    if emphasys_inspectors_results.error:
+        logger.debug("Error while reading inspectors from emphasys. Error {}".format(emphasys_inspectors_results.error))
 
 logger.debug("inspectors available on emphasys".format(emphasys_inspectors))
 
@@ -289,4 +303,7 @@ for inspection in bob_inspections_response.get('data', []):
 
         #     logger.debug("schedule call success")
     else:
-        logger.debug("Inspection agency ID not found")
\ No newline at end of file
+        logger.debug("Inspection agency ID not found")
+
+if bob_inspections_response.error:
+    logger.debug("Error while reading inspections from bob. Error {}".format(bob_inspections_response.error))